@@ -1,9 +1,26 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+import tempfile
+import threading
 import time
+import zlib
+from concurrent.futures import Future
+from dataclasses import dataclass
 from datetime import date
+from pathlib import Path
 
+import httpx
+import numpy as np
+import orjson
+import pandas as pd
 import requests
 import streamlit as st
 from dateutil.relativedelta import relativedelta
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.retry import Retry
 
 
 try:
@@ -18,6 +35,127 @@ except Exception:
 RESTCOUNTRIES_ALL = "https://restcountries.com/v3.1/all"
 CURRENCYAPI_BASE = "https://api.currencyapi.com/v3"
 
+# Country/currency mappings change on the order of years, so a local gzipped
+# snapshot of the RESTCountries payload is served for a week before refetching.
+COUNTRIES_SNAPSHOT = Path(__file__).with_name("countries.json.gz")
+COUNTRIES_TTL_S = 7 * 24 * 3600
+
+
+# Retry policy shared by the requests adapter and the async httpx path.
+# Retry-After is honoured but capped so a long value can't freeze the UI.
+REQUEST_TIMEOUT_S = 15
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_TOTAL = 5
+RETRY_BACKOFF_S = 0.5
+MAX_RETRY_AFTER_S = 10.0
+
+
+class _CappedRetry(Retry):
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER_S)
+
+
+def _retry_delay_s(response: httpx.Response, attempt: int) -> float:
+    # Async counterpart of _CappedRetry: Retry-After if given, else exponential backoff
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(Retry().parse_retry_after(retry_after), MAX_RETRY_AFTER_S)
+        except InvalidHeader:
+            pass
+    return min(RETRY_BACKOFF_S * 2**attempt, MAX_RETRY_AFTER_S)
+
+
+# Streamlit re-executes this script on every interaction, so process-wide
+# resources (sockets, DB handle, rate limiter) live in st.cache_resource.
+
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    # Pooled keep-alive sockets (and TLS) to restcountries / currencyapi
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=_CappedRetry(
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF_S,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            # Hand the final response back so raise_for_status() still surfaces
+            # an HTTPError (and the 429 message in the UI) once retries run out.
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Persistent rate store: historical rates never change, so they survive
+# restarts; today's rate is refreshed after LIVE_RATE_TTL_S.
+LIVE_RATE_TTL_S = 3600
+RATE_DB_PATH = Path(__file__).with_name("rates.sqlite")
+
+
+@st.cache_resource(show_spinner=False)
+def _rate_db() -> tuple[sqlite3.Connection, threading.Lock]:
+    db = sqlite3.connect(RATE_DB_PATH, check_same_thread=False)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS rates("
+        "day TEXT, home TEXT, dest TEXT, value REAL, fetched_at REAL, "
+        "PRIMARY KEY(day, home, dest))"
+    )
+    # Older stores filed /latest rows under the plain date; a row fetched before
+    # its day ended can't be a /historical rate, so drop those once.
+    db.execute(
+        "DELETE FROM rates WHERE day NOT LIKE 'latest:%' "
+        "AND fetched_at < CAST(strftime('%s', day, '+1 day', 'utc') AS REAL)"
+    )
+    db.commit()
+    return db, threading.Lock()
+
+
+# Token bucket for currencyapi: bursts of up to CURRENCYAPI_RATE_PER_S calls,
+# refilled one token every 1/CURRENCYAPI_RATE_PER_S seconds.
+CURRENCYAPI_RATE_PER_S = 10
+
+
+@st.cache_resource(show_spinner=False)
+def _rate_tokens() -> threading.BoundedSemaphore:
+    tokens = threading.BoundedSemaphore(CURRENCYAPI_RATE_PER_S)
+
+    def refill():
+        while True:
+            time.sleep(1 / CURRENCYAPI_RATE_PER_S)
+            try:
+                tokens.release()
+            except ValueError:
+                pass  # bucket already full
+
+    threading.Thread(target=refill, daemon=True).start()
+    return tokens
+
+
+# Upper bound on waiting for another caller's in-flight fetch: the owner's
+# worst case (every attempt timing out, every retry sleeping the max) + slack
+INFLIGHT_WAIT_S = (
+    (RETRY_TOTAL + 1) * REQUEST_TIMEOUT_S + RETRY_TOTAL * MAX_RETRY_AFTER_S + 10
+)
+
+
+@st.cache_resource(show_spinner=False)
+def _inflight() -> tuple[dict[tuple[str, str, str], Future], threading.Lock]:
+    # (day_key, home, dest) -> Future of the rate currently being fetched
+    return {}, threading.Lock()
+
+
+_SESSION = _http_session()
+_RATE_DB, _RATE_DB_LOCK = _rate_db()
+_RATE_TOKENS = _rate_tokens()
+_INFLIGHT, _INFLIGHT_LOCK = _inflight()
+
 
 # ----------------------------
 # Helpers
@@ -32,97 +170,355 @@ def _currencyapi_headers() -> dict:
     return {"apikey": CURRENCYAPI_KEY}
 
 
-def _get_json(url: str, params: dict | None = None, headers: dict | None = None, timeout: int = 15):
-    r = requests.get(url, params=params, headers=headers, timeout=timeout)
+def _get_json(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = REQUEST_TIMEOUT_S):
+    _RATE_TOKENS.acquire()
+    r = _SESSION.get(url, params=params, headers=headers, timeout=timeout)
     r.raise_for_status()
-    return r.json()
+    return orjson.loads(r.content)
+
+
+def _read_countries_snapshot(max_age_s: float | None = None) -> list | None:
+    # None when the snapshot is missing, too old, truncated or corrupt
+    try:
+        if max_age_s is not None and time.time() - COUNTRIES_SNAPSHOT.stat().st_mtime >= max_age_s:
+            return None
+        return orjson.loads(gzip.decompress(COUNTRIES_SNAPSHOT.read_bytes()))
+    except (OSError, EOFError, zlib.error, orjson.JSONDecodeError):
+        return None
+
+
+def _write_countries_snapshot(raw: bytes) -> None:
+    # Write to a temp file and swap it in so readers never see a partial file
+    try:
+        fd, tmp = tempfile.mkstemp(dir=COUNTRIES_SNAPSHOT.parent, prefix="countries.", suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(raw))
+        os.replace(tmp, COUNTRIES_SNAPSHOT)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
 
 
-@st.cache_data(ttl=24 * 3600)
-def load_countries():
+def _load_countries_json() -> list:
+    data = _read_countries_snapshot(COUNTRIES_TTL_S)
+    if data is not None:
+        return data
+
     params = {"fields": "name,cca2,currencies,flags,capital,region"}
-    data = _get_json(RESTCOUNTRIES_ALL, params=params)
+    try:
+        r = _SESSION.get(RESTCOUNTRIES_ALL, params=params, timeout=REQUEST_TIMEOUT_S)
+        r.raise_for_status()
+    except requests.RequestException:
+        # Stale snapshot beats no country list at all
+        data = _read_countries_snapshot()
+        if data is not None:
+            return data
+        raise
+
+    data = orjson.loads(r.content)
+    _write_countries_snapshot(r.content)
+    return data
+
+
+DEFAULT_COUNTRY = "Japan"
+
 
-    countries = []
+@dataclass(frozen=True)
+class CountryIndex:
+    names: tuple[str, ...]  # sorted
+    labels: tuple[str, ...]  # "Japan (JPY)", same order as names
+    by_name: dict[str, dict]
+    label_to_name: dict[str, str]
+    default_index: int  # DEFAULT_COUNTRY's position in names (0 if missing)
+    default_labels: tuple[str, ...]  # DEFAULT_COUNTRY's label, if present
+
+
+@st.cache_resource(ttl=COUNTRIES_TTL_S)
+def load_countries() -> CountryIndex:
+    """
+    Everything the country pickers need, built once per cache period so
+    reruns don't redo the O(N) work. Cached as a shared resource (not
+    st.cache_data) so reruns reuse the same read-only index instead of
+    unpickling a fresh copy; callers must not mutate it.
+    """
+    data = _load_countries_json()
+
+    # Column-per-field (one pass), then a single argsort on names
+    names, cca2s, flag_urls, capitals, regions = [], [], [], [], []
+    codes, currency_names, currency_symbols = [], [], []
     for c in data:
         name = (c.get("name") or {}).get("common")
         cca2 = c.get("cca2")
-        flags = (c.get("flags") or {}).get("png") or (c.get("flags") or {}).get("svg")
-        capital = (c.get("capital") or [None])[0]
-        region = c.get("region")
-
         currencies_obj = c.get("currencies") or {}
-        currency_codes = list(currencies_obj.keys())
-        if not name or not cca2 or not currency_codes:
+        if not name or not cca2 or not currencies_obj:
             continue
 
-        primary_code = currency_codes[0]
-        primary_name = (currencies_obj.get(primary_code) or {}).get("name") or primary_code
-        primary_symbol = (currencies_obj.get(primary_code) or {}).get("symbol") or ""
-
-        countries.append({
-            "name": name,
-            "cca2": cca2,
-            "flag_url": flags,
-            "capital": capital,
-            "region": region,
-            "currency_code": primary_code,
-            "currency_name": primary_name,
-            "currency_symbol": primary_symbol,
-        })
-
-    countries.sort(key=lambda x: x["name"])
-    return countries
+        flags = c.get("flags") or {}
+        primary_code = next(iter(currencies_obj))
+        primary = currencies_obj[primary_code] or {}
+
+        names.append(name)
+        cca2s.append(cca2)
+        flag_urls.append(flags.get("png") or flags.get("svg"))
+        capitals.append((c.get("capital") or [None])[0])
+        regions.append(c.get("region"))
+        codes.append(primary_code)
+        currency_names.append(primary.get("name") or primary_code)
+        currency_symbols.append(primary.get("symbol") or "")
+
+    order = sorted(range(len(names)), key=names.__getitem__)
+    columns = [
+        tuple(col[i] for i in order)
+        for col in (names, cca2s, flag_urls, capitals, regions, codes, currency_names, currency_symbols)
+    ]
+    names, codes = columns[0], columns[5]
+
+    keys = (
+        "name", "cca2", "flag_url", "capital", "region",
+        "currency_code", "currency_name", "currency_symbol",
+    )
+    by_name = {row[0]: dict(zip(keys, row)) for row in zip(*columns)}
+    labels = tuple(f"{n} ({code})" for n, code in zip(names, codes))
+
+    default_index = names.index(DEFAULT_COUNTRY) if DEFAULT_COUNTRY in by_name else 0
+    return CountryIndex(
+        names=names,
+        labels=labels,
+        by_name=by_name,
+        label_to_name=dict(zip(labels, names)),
+        default_index=default_index,
+        default_labels=(labels[default_index],) if DEFAULT_COUNTRY in by_name else (),
+    )
 
 
 def _parse_currencyapi_rate(resp_json: dict, currency: str) -> float:
-    data = resp_json.get("data") or {}
-    node = data.get(currency)
-    if not node or "value" not in node:
+    try:
+        value = resp_json["data"][currency]["value"]
+    except (KeyError, TypeError):
+        data = resp_json.get("data") or {}
         raise RuntimeError(
             f"currencyapi response missing data for {currency}. "
             f"Got keys: {list(data.keys())[:10]}"
-        )
-    return float(node["value"])
+        ) from None
+    # orjson yields int for whole-number literals; keep the float contract
+    return float(value)
 
 
-@st.cache_data(ttl=24 * 3600)
-def get_pair_rate_on_day(day: date, home: str, dest: str) -> float:
+def _rate_request(request_day: str | None, home: str, dest: str) -> tuple[str, dict]:
     """
-    Returns: 1 unit of 'home' equals X units of 'dest'
-
-    currencyapi endpoints:
+    currencyapi endpoints (request_day=None -> live rate):
       /latest?base_currency=HOME&currencies=DEST
       /historical?date=YYYY-MM-DD&base_currency=HOME&currencies=DEST
     """
+    if request_day is None:
+        return f"{CURRENCYAPI_BASE}/latest", {"base_currency": home, "currencies": dest}
+    return (
+        f"{CURRENCYAPI_BASE}/historical",
+        {"date": request_day, "base_currency": home, "currencies": dest},
+    )
+
+
+def _stored_rate(day_key: str, home: str, dest: str, max_age_s: float | None = None) -> float | None:
+    with _RATE_DB_LOCK:
+        row = _RATE_DB.execute(
+            "SELECT value, fetched_at FROM rates WHERE day = ? AND home = ? AND dest = ?",
+            (day_key, home, dest),
+        ).fetchone()
+    if row is None:
+        return None
+
+    value, fetched_at = row
+    if max_age_s is None or time.time() - fetched_at < max_age_s:
+        return value
+    return None
+
+
+def _store_rates(rows: list[tuple[str, str, str, float]]) -> None:
+    # Single transaction for the whole batch
+    now = time.time()
+    with _RATE_DB_LOCK, _RATE_DB:
+        _RATE_DB.executemany(
+            "INSERT OR REPLACE INTO rates(day, home, dest, value, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(day_key, home, dest, value, now) for day_key, home, dest, value in rows],
+        )
+
+
+def _coalesced(keys: list[tuple[str, str, str]], fetch) -> dict[tuple[str, str, str], float]:
+    """
+    Dedupes concurrent fetches (reruns, prefetch thread, button click):
+    calls fetch(owned_keys) -> {key: rate} only for keys nobody else is
+    already fetching, and waits on the in-flight futures for the rest.
+    """
+    futures, owned = {}, []
+    with _INFLIGHT_LOCK:
+        for key in keys:
+            fut = _INFLIGHT.get(key)
+            if fut is None:
+                fut = _INFLIGHT[key] = Future()
+                owned.append(key)
+            futures[key] = fut
+
+    if owned:
+        try:
+            fetched, error = fetch(owned), None
+        except BaseException as e:
+            fetched, error = {}, e
+        try:
+            # Resolve every owned future, whatever happened, so waiters never hang
+            for key in owned:
+                if error is not None:
+                    futures[key].set_exception(error)
+                elif key in fetched:
+                    futures[key].set_result(fetched[key])
+                else:
+                    futures[key].set_exception(RuntimeError(f"No rate fetched for {key}"))
+        finally:
+            with _INFLIGHT_LOCK:
+                for key in owned:
+                    _INFLIGHT.pop(key, None)
+        if error is not None:
+            raise error
+
+    return {key: fut.result(timeout=INFLIGHT_WAIT_S) for key, fut in futures.items()}
+
+
+def _rate_key(day: date) -> tuple[str, str | None, float | None]:
+    """
+    (day_key, request_day, max_age_s) for the store lookup and the fetch.
+    Live /latest rows get their own "latest:YYYY-MM-DD" key so they are never
+    served later as that date's immutable /historical rate.
+    """
+    if day == date.today():
+        return f"latest:{day.isoformat()}", None, LIVE_RATE_TTL_S
+    return day.isoformat(), day.isoformat(), None
+
+
+def get_pair_rates_on_day(day: date, home: str, dests: list[str]) -> dict[str, float]:
+    """
+    One currencyapi request for many destinations on `day`.
+    Returns: {dest: X} where 1 unit of 'home' equals X units of 'dest'
+    """
+    day_key, request_day, max_age_s = _rate_key(day)
+
+    rates = {}
+    missing = []
+    for dest in sorted(set(dests)):
+        cached = 1.0 if dest == home else _stored_rate(day_key, home, dest, max_age_s)
+        if cached is None:
+            missing.append(dest)
+        else:
+            rates[dest] = cached
+    if not missing:
+        return rates
+
+    def fetch(keys):
+        # currencyapi accepts a comma-separated `currencies` list -> one call per day
+        codes = [code for _, _, code in keys]
+        url, params = _rate_request(request_day, home, ",".join(codes))
+        j = _get_json(url, params=params, headers=_currencyapi_headers())
+        fetched = {key: _parse_currencyapi_rate(j, key[2]) for key in keys}
+        _store_rates([(*key, rate) for key, rate in fetched.items()])
+        return fetched
+
+    fetched = _coalesced([(day_key, home, code) for code in missing], fetch)
+    rates.update({code: rate for (_, _, code), rate in fetched.items()})
+    return rates
+
+
+async def _afetch_rate(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, day: date, home: str, dest: str
+) -> float:
+    # One (day, home, dest) rate for get_pair_rates
     if home == dest:
         return 1.0
 
-    headers = _currencyapi_headers()
+    _, request_day, _ = _rate_key(day)
+    url, params = _rate_request(request_day, home, dest)
+    for attempt in range(RETRY_TOTAL + 1):
+        async with sem:
+            await asyncio.to_thread(_RATE_TOKENS.acquire)
+            r = await client.get(url, params=params, headers=_currencyapi_headers())
+        if r.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            break
+        await asyncio.sleep(_retry_delay_s(r, attempt))
+    r.raise_for_status()
+    return _parse_currencyapi_rate(orjson.loads(r.content), dest)
+
+
+async def _gather_rates(pairs: tuple[tuple[date, str, str], ...]) -> list[float]:
+    # Keep concurrency under currencyapi's per-key limits
+    sem = asyncio.Semaphore(8)
+    # HTTP/2 multiplexes the requests as streams over one TLS connection,
+    # so a handful of sockets is plenty (needs httpx[http2] / h2)
+    async with httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+        timeout=REQUEST_TIMEOUT_S,
+    ) as client:
+        return await asyncio.gather(
+            *[_afetch_rate(client, sem, day, home, dest) for day, home, dest in pairs]
+        )
+
 
-    if day == date.today():
-        url = f"{CURRENCYAPI_BASE}/latest"
-        params = {"base_currency": home, "currencies": dest}
-        j = _get_json(url, params=params, headers=headers)
-        return _parse_currencyapi_rate(j, dest)
+def get_pair_rates(pairs: tuple[tuple[date, str, str], ...]) -> list[float]:
+    """
+    Concurrently fetches many (day, home, dest) pairs.
+    Returns: rates in the same order as `pairs`, where 1 unit of 'home' equals X units of 'dest'.
+    """
+    keys, rates = [], []
+    for day, home, dest in pairs:
+        day_key, _, max_age_s = _rate_key(day)
+        keys.append((day_key, home, dest))
+        rates.append(_stored_rate(day_key, home, dest, max_age_s))
+
+    missing = {key: pair for key, pair, rate in zip(keys, pairs, rates) if rate is None}
+    if not missing:
+        return rates
+
+    def fetch(owned):
+        fetched = dict(zip(owned, asyncio.run(_gather_rates(tuple(missing[k] for k in owned)))))
+        _store_rates([(*key, rate) for key, rate in fetched.items()])
+        return fetched
 
-    url = f"{CURRENCYAPI_BASE}/historical"
-    params = {"date": day.isoformat(), "base_currency": home, "currencies": dest}
-    j = _get_json(url, params=params, headers=headers)
-    return _parse_currencyapi_rate(j, dest)
+    fetched = _coalesced(list(missing), fetch)
+    return [fetched.get(key, rate) for key, rate in zip(keys, rates)]
 
 
-def pct_change(current: float, past: float) -> float:
+def _warm(home: str, dest: str, days: list[date]) -> None:
+    # Best-effort prefetch into the rate store; the button click reports errors
+    try:
+        get_pair_rates(tuple((d, home, dest) for d in days))
+    except Exception:
+        pass
+
+
+def pct_change(current: float | np.ndarray, past: float | np.ndarray) -> float | np.ndarray:
     return (current - past) / past * 100.0
 
 
+# Simple MVP thresholds
+FAVORABLE_PCT = 7.5
+MORE_FAVORABLE = "🟢 More favorable than ~1y ago"
+LESS_FAVORABLE = "🔴 Less favorable than ~1y ago"
+SIMILAR = "🟡 Similar to ~1y ago"
+
+
 def favorability_label(diff_vs_1y: float) -> str:
-    # Simple MVP thresholds
-    if diff_vs_1y >= 7.5:
-        return "🟢 More favorable than ~1y ago"
-    if diff_vs_1y <= -7.5:
-        return "🔴 Less favorable than ~1y ago"
-    return "🟡 Similar to ~1y ago"
+    return str(favorability_labels(np.asarray([diff_vs_1y]))[0])
+
+
+def favorability_labels(diffs_vs_1y: np.ndarray) -> np.ndarray:
+    return np.select(
+        [diffs_vs_1y >= FAVORABLE_PCT, diffs_vs_1y <= -FAVORABLE_PCT],
+        [MORE_FAVORABLE, LESS_FAVORABLE],
+        SIMILAR,
+    )
 
 
 # ----------------------------
@@ -134,7 +530,7 @@ st.set_page_config(page_title="Currensee", page_icon="💱", layout="centered")
 st.title("💱 Currensee")
 st.caption("A quick way to check whether a destination’s exchange rate is historically favorable.")
 
-countries = load_countries()
+idx = load_countries()
 
 home_currency = st.selectbox(
     "Home currency",
@@ -143,14 +539,13 @@ home_currency = st.selectbox(
     help="The currency you earn/spend (e.g., USD).",
 )
 
-country_names = [c["name"] for c in countries]
 chosen_name = st.selectbox(
     "Primary destination country",
-    country_names,
-    index=country_names.index("Japan") if "Japan" in country_names else 0,
+    idx.names,
+    index=idx.default_index,
 )
 
-chosen = next(c for c in countries if c["name"] == chosen_name)
+chosen = idx.by_name[chosen_name]
 dest_currency = chosen["currency_code"]
 
 colA, colB = st.columns([1, 3], vertical_alignment="center")
@@ -172,6 +567,17 @@ d1y = today - relativedelta(years=1)
 d3y = today - relativedelta(years=3)
 d5y = today - relativedelta(years=5)
 
+# Warm the snapshot rates in the background once per selection so the
+# button click below is served from the rate store.
+warm_key = (home_currency, dest_currency, today)
+if st.session_state.get("warmed_pair") != warm_key:
+    st.session_state["warmed_pair"] = warm_key
+    threading.Thread(
+        target=_warm,
+        args=(home_currency, dest_currency, [today, d1y, d3y, d5y]),
+        daemon=True,
+    ).start()
+
 fetch_single = st.button("Fetch snapshot for primary destination")
 
 if not fetch_single:
@@ -183,11 +589,10 @@ else:
     with st.spinner("Fetching exchange rates…"):
         t0 = time.perf_counter()
         try:
-            r_today = get_pair_rate_on_day(today, home_currency, dest_currency)
-            r_1y = get_pair_rate_on_day(d1y, home_currency, dest_currency)
-            r_3y = get_pair_rate_on_day(d3y, home_currency, dest_currency)
-            r_5y = get_pair_rate_on_day(d5y, home_currency, dest_currency)
-        except requests.HTTPError as e:
+            r_today, r_1y, r_3y, r_5y = get_pair_rates(
+                tuple((d, home_currency, dest_currency) for d in (today, d1y, d3y, d5y))
+            )
+        except (requests.HTTPError, httpx.HTTPStatusError) as e:
             if getattr(e.response, "status_code", None) == 429:
                 st.error("Too many requests (429). You may be temporarily throttled — try again in a bit.")
             else:
@@ -227,20 +632,10 @@ st.caption(
     "Sorted by most favorable (largest increase in home→local rate)."
 )
 
-# Build labels like "Japan (JPY)"
-name_to_country = {c["name"]: c for c in countries}
-labels = [f"{c['name']} ({c['currency_code']})" for c in countries]
-
-default_labels = []
-for l in labels:
-    if l.startswith("Japan ("):
-        default_labels.append(l)
-        break
-
 selected_labels = st.multiselect(
     "Select destination countries to compare",
-    options=labels,
-    default=default_labels,
+    options=idx.labels,
+    default=idx.default_labels,
     max_selections=8,
 )
 
@@ -252,35 +647,32 @@ if fetch_compare:
     else:
         with st.spinner("Fetching comparison snapshot…"):
             t0 = time.perf_counter()
-            rows = []
             try:
-                for lab in selected_labels:
-                    # parse "Country (CCY)" -> "Country"
-                    name = lab.rsplit(" (", 1)[0]
-                    c = name_to_country.get(name)
-                    if not c:
-                        continue
-
-                    dest = c["currency_code"]
-
-                    if home_currency == dest:
-                        r_today = r_1y = 1.0
-                    else:
-                        r_today = get_pair_rate_on_day(today, home_currency, dest)
-                        r_1y = get_pair_rate_on_day(d1y, home_currency, dest)
-
-                    change = pct_change(r_today, r_1y)
-
-                    rows.append({
-                        "Country": c["name"],
-                        "Currency": dest,
-                        "Today Rate": r_today,
-                        "~1y Ago Rate": r_1y,
-                        "% vs ~1y": change,
-                        "Verdict": favorability_label(change),
-                    })
-
-            except requests.HTTPError as e:
+                picked = [
+                    idx.by_name[idx.label_to_name[lab]]
+                    for lab in selected_labels
+                    if lab in idx.label_to_name
+                ]
+
+                # One batched request per day instead of one per destination
+                codes = [c["currency_code"] for c in picked]
+                rates_today = get_pair_rates_on_day(today, home_currency, codes)
+                rates_1y = get_pair_rates_on_day(d1y, home_currency, codes)
+
+                today_arr = np.array([rates_today[code] for code in codes])
+                y1_arr = np.array([rates_1y[code] for code in codes])
+                change = pct_change(today_arr, y1_arr)
+
+                df = pd.DataFrame({
+                    "Country": [c["name"] for c in picked],
+                    "Currency": codes,
+                    "Today Rate": today_arr,
+                    "~1y Ago Rate": y1_arr,
+                    "% vs ~1y": change,
+                    "Verdict": favorability_labels(change),
+                })
+
+            except (requests.HTTPError, httpx.HTTPStatusError) as e:
                 if getattr(e.response, "status_code", None) == 429:
                     st.error("Too many requests (429). You may be temporarily throttled — try again in a bit.")
                 else:
@@ -294,26 +686,24 @@ if fetch_compare:
             finally:
                 st.session_state["compare_fetch_s"] = round(time.perf_counter() - t0, 3)
 
-        # Sort and display
-        rows.sort(key=lambda r: r["% vs ~1y"], reverse=True)
-
-        # Render a clean table (no per-destination columns)
+        # Render a clean table (no per-destination columns). Sorting is vectorized;
+        # the Styler keeps the baseline's thousands separators (printf-style
+        # column_config formats can't group) while the cells stay numeric.
         st.dataframe(
-            [
-                {
-                    "Country": r["Country"],
-                    "Currency": r["Currency"],
-                    f"Today ({home_currency}→local)": f"{r['Today Rate']:,.4f}",
-                    f"~1y Ago ({home_currency}→local)": f"{r['~1y Ago Rate']:,.4f}",
-                    "% vs ~1y": f"{r['% vs ~1y']:+.1f}%",
-                    "Verdict": r["Verdict"],
-                }
-                for r in rows
-            ],
+            df.sort_values("% vs ~1y", ascending=False, ignore_index=True).style.format({
+                "Today Rate": "{:,.4f}",
+                "~1y Ago Rate": "{:,.4f}",
+                "% vs ~1y": "{:+.1f}%",
+            }),
+            column_config={
+                "Today Rate": f"Today ({home_currency}→local)",
+                "~1y Ago Rate": f"~1y Ago ({home_currency}→local)",
+            },
             use_container_width=True,
         )
 
-        top = rows[0]
+        # Only the single best row is spotlighted: O(N) argmax, no sort needed
+        top = df.loc[df["% vs ~1y"].idxmax()]
         st.success(
             f"Most favorable now (vs ~1y): **{top['Country']} ({top['Currency']})** "
             f"at **{top['% vs ~1y']:+.1f}%**"